@@ -4,10 +4,14 @@ from typing import List, Tuple
 import numpy as np
 import pytest
 import tensorflow as tf
-from numpy.testing import assert_almost_equal
+import tensorflow_probability as tfp
+from numpy.testing import assert_allclose, assert_almost_equal
 
+from unlockgnn.datalib import metrics
 from unlockgnn.datalib.metrics import MetricAnalyser
 
+tfd = tfp.distributions
+
 # * Generate some test data
 uni_test_points = np.linspace(-1.0, 1.0)
 uni_test_vals = uni_test_points * 1.1
@@ -88,3 +92,59 @@ def test_pis(analyser):
     expected_pi = np.zeros(predicted_pi.shape)
     expected_pi[predicted_pi >= 0.5] = 1
     assert_almost_equal(observed_pi, expected_pi)
+
+
+def test_pis_random(mocker):
+    """Test the percentile intervals against a direct count for random residuals."""
+    rng = np.random.default_rng(0)
+    targets = rng.normal(size=200)
+    stddevs = rng.uniform(0.5, 2.0, size=200)
+
+    dist = mocker.Mock()
+    dist.mean.return_value = tf.constant(targets + rng.normal(size=200))
+    dist.stddev.return_value = tf.constant(stddevs)
+
+    analyser = MetricAnalyser(tf.constant(targets), tf.constant(targets), dist)
+    predicted_pi, observed_pi = analyser.pis
+
+    norm_resids = analyser.residuals / stddevs
+    bounds = tfd.Normal(0, 1).quantile(predicted_pi).numpy()
+    expected_pi = np.array([np.mean(norm_resids <= bound) for bound in bounds])
+    assert_almost_equal(observed_pi, expected_pi)
+
+
+def test_pi_bounds():
+    """Test the percentile bounds match the standard normal quantiles."""
+    expected = tfd.Normal(0, 1).quantile(metrics._PREDICTED_PI).numpy()
+    assert metrics._PI_BOUNDS.dtype == expected.dtype
+    assert_allclose(metrics._PI_BOUNDS, expected, rtol=1e-5)
+
+
+def test_update_with_predictions(analyser):
+    """Test updating the mean and standard deviations from precalculated values."""
+    mean = tf.zeros(analyser.val_obs.shape, dtype=tf.float64)
+    stddevs = 2 * tf.ones(analyser.val_obs.shape, dtype=tf.float64)
+    analyser.update_mean_and_stddevs((mean, stddevs))
+
+    assert_almost_equal(analyser.mean, mean.numpy())
+    assert_almost_equal(analyser.sharpness, 2)
+
+
+def test_variation_random(analyser):
+    """Test the coefficient of variation for varying standard deviations."""
+    rng = np.random.default_rng(0)
+    stddevs = rng.uniform(0.5, 2.0, size=analyser.val_obs.shape)
+    analyser.update_mean_and_stddevs((analyser.mean, stddevs))
+
+    stdev_mean = stddevs.mean()
+    expected = np.sqrt(np.sum(np.square(stddevs - stdev_mean)))
+    expected /= stdev_mean * (len(stddevs) - 1)
+    assert_almost_equal(analyser.variation, expected)
+
+
+def test_sharpness_random(analyser):
+    """Test the sharpness for varying standard deviations."""
+    rng = np.random.default_rng(0)
+    stddevs = rng.uniform(0.5, 2.0, size=analyser.val_obs.shape)
+    analyser.update_mean_and_stddevs((analyser.mean, stddevs))
+    assert_almost_equal(analyser.sharpness, np.sqrt(np.mean(np.square(stddevs))))
@@ -3,6 +3,7 @@ import numpy as np
 import pymatgen as mg
 import pytest
 from megnet.data.crystal import CrystalGraph
+from megnet.layers import Set2Set
 
 from unlockgnn.datalib import preprocessing as preproc
 
@@ -11,6 +12,8 @@ cg = CrystalGraph()
 
 cubic_lattice = mg.Lattice.cubic(4.2)
 cscl = mg.Structure(cubic_lattice, ["Cs", "Cl"], [[0, 0, 0], [0.5, 0.5, 0.5]])
+# A single-atom structure, which has as many atoms as graphs
+po = mg.Structure(mg.Lattice.cubic(3.35), ["Po"], [[0, 0, 0]])
 
 
 @pytest.fixture
@@ -49,3 +52,102 @@ def test_get_layer_out_graph(layer_extractor):
     cscl_graph = cg.convert(cscl)
     layer_extractor.get_layer_output_graph(cscl_graph)
     layer_extractor.layer_eval.assert_called_once()
+
+
+def test_get_layer_outs_batched(layer_extractor):
+    """Test getting layer outputs for a batch of structures."""
+    layer_extractor.layer_eval.return_value = [np.zeros((1, 3, 96))]
+    layer_outs = layer_extractor.get_layer_outputs([cscl] * 3)
+    layer_extractor.layer_eval.assert_called_once()
+    assert layer_outs.shape == (3, 96)
+
+
+def test_get_layer_outs_per_atom(layer_extractor):
+    """Test that a layer giving one output per atom is rejected."""
+    n_atoms = len(cscl)
+    layer_extractor.layer_eval.return_value = [np.zeros((1, 3 * n_atoms, 16))]
+    with pytest.raises(ValueError, match=f"Layer {test_index} "):
+        layer_extractor.get_layer_outputs([cscl] * 3)
+
+
+def test_get_layer_outs_empty(layer_extractor, mocker):
+    """Test getting layer outputs for no structures."""
+    layer_extractor.conc_layer_output = mocker.Mock(shape=(1, None, 96))
+    layer_outs = layer_extractor.get_layer_outputs([])
+    layer_extractor.layer_eval.assert_not_called()
+    assert layer_outs.shape == (0, 96)
+
+
+def sum_bonds(inputs):
+    """Sum the bond features of each graph in a merged batch, as a mock layer."""
+    batch = inputs[0]
+    bonds, gbond = batch[1][0], batch[6][0]
+    bond_sums = np.bincount(gbond, weights=bonds.reshape(len(gbond), -1).sum(axis=1))
+    return [bond_sums.reshape(1, -1, 1)]
+
+
+def test_get_layer_outs_parallel(layer_extractor, mocker):
+    """Test that converting structures in parallel matches serial conversion."""
+    structs = [
+        mg.Structure(
+            mg.Lattice.cubic(4.0 + 0.05 * i), ["Cs", "Cl"], [[0, 0, 0], [0.5, 0.5, 0.5]]
+        )
+        for i in range(20)
+    ]
+    layer_extractor.layer_eval.side_effect = sum_bonds
+    executor = mocker.patch.object(
+        preproc, "ProcessPoolExecutor", wraps=preproc.ProcessPoolExecutor
+    )
+
+    serial = layer_extractor.get_layer_outputs(structs, n_jobs=1)
+    parallel = layer_extractor.get_layer_outputs(structs, n_jobs=2)
+    # Workers are spawned, rather than forked from a process running TensorFlow
+    mp_context = executor.call_args.kwargs["mp_context"]
+    assert mp_context.get_start_method() == "spawn"
+    assert serial.shape == (20, 1)
+    # Each structure's bonds are longer than the last's
+    assert np.all(np.diff(serial[:, 0]) > 0)
+    assert np.array_equal(serial, parallel)
+
+
+@pytest.fixture
+def readout_model(mocker):
+    """Create a mock model with a MEGNet-like `Set2Set` readout.
+
+    Layers -9 to -6 are per atom or per bond, -5 and -4 are the readout,
+    then the concatenation layer is at index -3.
+
+    """
+    mock_model = mocker.MagicMock()
+    mock_model.graph_converter = cg
+    mock_model.layers = [mocker.MagicMock() for _ in range(9)]
+    mock_model.layers[4:6] = [mocker.MagicMock(spec=Set2Set) for _ in range(2)]
+    mocker.patch("tensorflow.keras.backend.function")
+    return mock_model
+
+
+def test_per_atom_layer_single_atom(readout_model):
+    """Test that a per-atom layer is rejected, even for single-atom structures."""
+    with pytest.raises(ValueError, match="Layer -6 "):
+        preproc.LayerExtractor(readout_model, -6)
+
+
+def test_per_graph_layer_single_atom(readout_model):
+    """Test that a per-graph layer is accepted for single-atom structures."""
+    layer_extractor = preproc.LayerExtractor(readout_model, -3)
+    layer_extractor.layer_eval.return_value = [np.zeros((1, 3, 16))]
+    layer_outs = layer_extractor.get_layer_outputs([po] * 3)
+    assert layer_outs.shape == (3, 16)
+
+
+def test_merge_inputs():
+    """Test merging graph inputs into a single batch."""
+    cscl_inp = cg.graph_to_input(cg.convert(cscl))
+    merged = preproc.merge_inputs([cscl_inp, cscl_inp])
+    n_atoms = cscl_inp[0].shape[1]
+    n_bonds = cscl_inp[3].shape[1]
+
+    assert merged[0].shape[1] == 2 * n_atoms
+    assert merged[2].shape[1] == 2
+    assert np.array_equal(merged[3][:, n_bonds:], cscl_inp[3] + n_atoms)
+    assert np.array_equal(merged[5], np.repeat([[0, 1]], n_atoms, axis=1))
@@ -12,29 +12,55 @@ import pytest
 from megnet.models import MEGNetModel
 
 import unlockgnn.datalib.preprocessing as preproc
+from unlockgnn.utilities import serialize_array
 
-eye3 = np.eye(3)
-max_elem_tests = [
-    # We expect a single array input to
-    # lead to return of input
-    ([eye3], eye3),
-    # Check for two arrays, three arrays, ... and five arrays
-    *[([eye3 * (j + 1) for j in range(i)], eye3 * i) for i in range(2, 6)],
-    # And now with some mixup between the different elements
-    ([eye3, 1 - eye3], np.ones((3, 3))),
-]
 
+@pytest.mark.parametrize(
+    "layer_outs,expected",
+    [
+        (np.array([[1.0, -2.0], [-3.0, 1.0]]), np.array([3.0, 2.0])),
+        # Zeros are replaced by one
+        (np.array([[0.0, -2.0], [0.0, 1.0]]), np.array([1.0, 2.0])),
+    ],
+)
+def test_calc_scaling_factor(layer_outs, expected):
+    """Test the scaling factor is the elementwise greatest absolute value."""
+    assert np.array_equal(
+        preproc.LayerScaler._calc_scaling_factor(layer_outs), expected
+    )
 
-@pytest.mark.parametrize("test_inp,expected", max_elem_tests)
-def test_get_max(test_inp, expected):
-    """Test `get_max_elements`."""
-    assert np.array_equal(preproc.get_max_elements(test_inp), expected)
+
+@pytest.mark.parametrize(
+    "n_jobs,expected", [(1, 1), (4, 4), (-1, 8), (-2, 7), (-20, 1)]
+)
+def test_get_n_workers(mocker, n_jobs, expected):
+    """Test `get_n_workers` follows the `scikit-learn` `n_jobs` convention."""
+    mocker.patch("os.cpu_count", return_value=8)
+    assert preproc.get_n_workers(n_jobs) == expected
+
+
+def test_get_n_workers_zero():
+    """Test that `get_n_workers` rejects zero jobs."""
+    with pytest.raises(ValueError):
+        preproc.get_n_workers(0)
+
+
+def test_convert_graph_df():
+    """Test deserializing graphs from a DataFrame."""
+    array_cols = ["index1", "index2", "atom", "bond", "state"]
+    graph = {col: np.arange(i + 1) for i, col in enumerate(array_cols)}
+    df = pd.DataFrame({col: [serialize_array(arr)] * 2 for col, arr in graph.items()})
+
+    graphs = preproc.convert_graph_df(df)
+    assert len(graphs) == 2
+    for converted in graphs:
+        assert all(np.array_equal(converted[col], graph[col]) for col in array_cols)
 
 
 """Mock fixtures
 
 These are used to mock `LayerExtractor` so that
-its `get_layer_output` method can be configured to return the
+its `get_layer_output` and `get_layer_outputs` methods can be configured to return the
 desired value for a given, mocked `pymatgen.Strucuture`.
 
 """
@@ -69,6 +95,9 @@ def mock_layer_scaler(mocker, mock_model, request):
     layer_extractor = "unlockgnn.datalib.preprocessing.LayerExtractor"
     mock_le = mocker.patch(layer_extractor, autospec=True)
     mock_le.return_value.get_layer_output = lambda struct: struct.layer_output
+    mock_le.return_value.get_layer_outputs = lambda structs, **kwargs: np.stack(
+        [struct.layer_output for struct in structs]
+    )
 
     try:
         layer_index = request.param
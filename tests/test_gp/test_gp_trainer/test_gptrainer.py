@@ -1,4 +1,125 @@
 """Tests for the `GPTrainer` class."""
+import numpy as np
 import pytest
+import tensorflow as tf
+from numpy.testing import assert_allclose
 
-from unlockgnn.gp.gp_trainer import GPTrainer
+from unlockgnn.gp.gp_trainer import GPTrainer, convert_index_points
+
+rng = np.random.default_rng(0)
+train_points = convert_index_points(rng.random((20, 3)))
+train_obs = tf.constant(rng.random(20), dtype=tf.float64)
+val_points = convert_index_points(rng.random((5, 3)))
+val_obs = tf.constant(rng.random(5), dtype=tf.float64)
+
+
+@pytest.fixture
+def gp_trainer():
+    """Create a `GPTrainer` without checkpointing."""
+    return GPTrainer(train_points, train_obs)
+
+
+def test_evaluate_matches_model(gp_trainer):
+    """Test that the validation evaluation matches a regression model."""
+    evaluation = gp_trainer._evaluate(val_points, val_obs)
+    gprm = gp_trainer.get_model(val_points)
+
+    assert_allclose(evaluation["mean"], gprm.mean())
+    assert_allclose(evaluation["stddev"], gprm.stddev())
+    assert_allclose(evaluation["nll"], -gprm.log_prob(val_obs))
+
+
+def test_evaluate_tracks_parameters(gp_trainer):
+    """Test that the traced evaluation reflects updated kernel parameters."""
+    before = gp_trainer._evaluate(val_points, val_obs)["stddev"].numpy()
+    gp_trainer.amplitude.assign(np.float64(2.0))
+    after = gp_trainer._evaluate(val_points, val_obs)["stddev"].numpy()
+
+    # Scaling the amplitude scales the posterior, up to the jitter
+    assert_allclose(after, 2 * before, rtol=1e-5)
+
+
+def test_train_model_metrics(gp_trainer):
+    """Test that training reports metrics for the updated kernel parameters."""
+    (metrics,) = gp_trainer.train_model(
+        val_points, val_obs, epochs=1, metrics=["nll", "mae"]
+    )
+    gprm = gp_trainer.get_model(val_points)
+
+    assert_allclose(metrics["nll"], -gprm.log_prob(val_obs))
+    assert_allclose(metrics["mae"], np.mean(np.abs(gprm.mean() - val_obs)))
+
+
+def test_single_precision():
+    """Test that a single precision `GPTrainer` trains and predicts in `float32`."""
+    gp_trainer = GPTrainer(train_points, train_obs, dtype=tf.float32)
+    metrics = list(
+        gp_trainer.train_model(val_points, val_obs, epochs=2, metrics=["mae"])
+    )
+    assert len(metrics) == 2
+
+    mean, stddev = gp_trainer.predict(tf.cast(val_points, tf.float32))
+    assert mean.dtype == stddev.dtype == tf.float32
+
+
+def test_cached_trainable_variables(gp_trainer):
+    """Test that the cached trainable variables match the module's."""
+    assert {id(var) for var in gp_trainer._trainable_vars} == {
+        id(var) for var in gp_trainer.trainable_variables
+    }
+    assert len(gp_trainer._trainable_vars) == 2
+
+
+def test_checkpoint_round_trip(tmp_path):
+    """Test that kernel parameters are restored from a checkpoint."""
+    gp_trainer = GPTrainer(train_points, train_obs, tmp_path)
+    gp_trainer.amplitude.assign(np.float64(2.0))
+    gp_trainer.length_scale.assign(np.float64(0.5))
+    gp_trainer.ckpt_manager.save()
+
+    restored = GPTrainer(train_points, train_obs, tmp_path)
+    assert_allclose(restored.amplitude.numpy(), 2.0)
+    assert_allclose(restored.length_scale.numpy(), 0.5)
+
+
+def test_legacy_checkpoint(tmp_path):
+    """Test restoring a checkpoint with untransformed kernel parameters."""
+    legacy_ckpt = tf.train.Checkpoint(
+        step=tf.Variable(3, dtype=tf.int32),
+        amp=tf.Variable(2.0, dtype=tf.float64),
+        ls=tf.Variable(0.5, dtype=tf.float64),
+        loss=tf.Variable(1.0, dtype=tf.float64),
+        val_nll=tf.Variable(1.0, dtype=tf.float64),
+        val_mae=tf.Variable(1.0, dtype=tf.float64),
+        val_sharpness=tf.Variable(1.0, dtype=tf.float64),
+        val_coeff_var=tf.Variable(1.0, dtype=tf.float64),
+        val_cal_err=tf.Variable(1.0, dtype=tf.float64),
+    )
+    tf.train.CheckpointManager(legacy_ckpt, tmp_path, max_to_keep=1).save()
+
+    gp_trainer = GPTrainer(train_points, train_obs, tmp_path)
+    assert gp_trainer.training_steps.numpy() == 3
+    assert_allclose(gp_trainer.amplitude.numpy(), 2.0)
+    assert_allclose(gp_trainer.length_scale.numpy(), 0.5)
+
+
+@pytest.mark.parametrize("dtype", [tf.float64, tf.float32])
+def test_jit_compile(dtype):
+    """Test that an XLA-compiled `GPTrainer` trains and predicts."""
+    gp_trainer = GPTrainer(train_points, train_obs, jit_compile=True, dtype=dtype)
+    metrics = list(
+        gp_trainer.train_model(val_points, val_obs, epochs=2, metrics=["mae"])
+    )
+    assert len(metrics) == 2
+
+    mean, stddev = gp_trainer.predict(tf.cast(val_points, dtype))
+    assert mean.shape == stddev.shape == (5,)
+    assert mean.dtype == stddev.dtype == dtype
+
+
+def test_checkpoint_dtype_mismatch(tmp_path):
+    """Test that restoring a checkpoint of a different precision fails clearly."""
+    GPTrainer(train_points, train_obs, tmp_path).ckpt_manager.save()
+
+    with pytest.raises(ValueError, match="float64 kernel parameters"):
+        GPTrainer(train_points, train_obs, tmp_path, dtype=tf.float32)
@@ -1,6 +1,7 @@
 """Tests for the `convert_index_points` function."""
 import numpy as np
 import pytest
+import tensorflow as tf
 
 from unlockgnn.gp.gp_trainer import convert_index_points
 
@@ -25,3 +26,19 @@ def test_conversion(input, exp_shape):
     converted = convert_index_points(input)
     assert converted.numpy().shape == exp_shape
     assert np.array_equal(converted.numpy().squeeze(), input)
+
+
+def test_conversion_dtype():
+    """Test that non-contiguous, integer inputs are converted to `float64`."""
+    input = np.arange(12).reshape((3, 4))[:, ::2]
+    converted = convert_index_points(input)
+    assert converted.dtype == tf.float64
+    assert converted.numpy().shape == (3, 2, 1)
+    assert np.array_equal(converted.numpy().squeeze(), input)
+
+
+def test_conversion_single_precision():
+    """Test converting points to a `float32` Tensor."""
+    converted = convert_index_points(np.stack([three_space] * 3), dtype=tf.float32)
+    assert converted.dtype == tf.float32
+    assert converted.numpy().shape == (3, 3, 1, 1)
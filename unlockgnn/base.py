@@ -48,6 +48,8 @@ class ProbGNN(ABC):
             Only applies when loading a model.
         sf: The pre-calculated scaling factor. Only applicable when loading
             a pre-trained model.
+        n_jobs: The number of processes to use for converting structures
+            to graphs when extracting layer outputs. ``-1`` uses all processors.
         **kwargs: Keyword arguments to pass to :meth:`make_gnn`.
 
     Attributes:
@@ -67,6 +69,8 @@ class ProbGNN(ABC):
         num_inducing_points: The number of inducing points for the `VGP`.
             Shoud be `None` for `gp_type='GP'`.
         sf: The scaling factor. Defaults to `None` when uncalculated.
+        n_jobs: The number of processes to use for converting structures
+            to graphs when extracting layer outputs.
         gnn_ckpt_path: The path to the GNN checkpoints.
         gnn_save_path: The path to the saved GNN.
         gp_ckpt_path: The path to the GP checkpoints.
@@ -93,6 +97,7 @@ class ProbGNN(ABC):
         num_inducing_points: Optional[int] = None,
         training_stage: int = 0,
         sf: Optional[np.ndarray] = None,
+        n_jobs: int = 1,
         **kwargs,
     ):
         """Initialize class."""
@@ -125,6 +130,7 @@ class ProbGNN(ABC):
         self.sf = sf
         self.layer_index = layer_index
         self.num_inducing_points = num_inducing_points
+        self.n_jobs = n_jobs
 
         self.gnn_ckpt_path = self.save_dir / "gnn_ckpts"
         self.gnn_save_path = self.save_dir / "gnn_model"
@@ -147,7 +153,7 @@ class ProbGNN(ABC):
         if training_stage < 2:
             self.gp: Optional[Union[GPTrainer, SingleLayerVGP]] = None
         else:
-            index_points = np.stack(self.get_index_points(self.train_structs))
+            index_points = self.get_index_points(self.train_structs)
 
             if gp_type == "VGP":
                 index_points = tf.constant(index_points, dtype=tf.float64)
@@ -207,23 +213,25 @@ class ProbGNN(ABC):
 
         """
         ls = LayerScaler.from_train_data(
-            self.gnn, self.train_structs, layer_index=self.layer_index
+            self.gnn,
+            self.train_structs,
+            layer_index=self.layer_index,
+            n_jobs=self.n_jobs,
         )
         self.sf = ls.sf
 
-    def get_index_points(
-        self, structures: List[pymatgen.Structure]
-    ) -> List[np.ndarray]:
+    def get_index_points(self, structures: List[pymatgen.Structure]) -> np.ndarray:
         """Determine and preprocess index points for GP training.
 
         Args:
             structures: A list of structrues to convert to inputs.
 
         Returns:
-            index_points: The feature arrays of the structures.
+            index_points: The feature arrays of the structures, stacked
+                along the first axis.
 
         """
-        ls = LayerScaler(self.gnn, self.sf, self.layer_index)
+        ls = LayerScaler(self.gnn, self.sf, self.layer_index, n_jobs=self.n_jobs)
         return ls.structures_to_input(structures)
 
     def train_uq(self, epochs: int = 500, **kwargs):
@@ -233,8 +241,8 @@ class ProbGNN(ABC):
         scale them and train the appropriate GP (from :attr:`gp_type`).
 
         """
-        training_idxs = np.stack(self.get_index_points(self.train_structs))
-        val_idxs = np.stack(self.get_index_points(self.val_structs))
+        training_idxs = self.get_index_points(self.train_structs)
+        val_idxs = self.get_index_points(self.val_structs)
 
         if self.gp_type == "GP":
             training_idxs = convert_index_points(training_idxs)
@@ -447,8 +455,15 @@ class ProbGNN(ABC):
         return data
 
     @classmethod
-    def load(cls, dirname: Union[Path, str]) -> ProbGNN:
-        """Load a full-stack model."""
+    def load(cls, dirname: Union[Path, str], n_jobs: int = 1) -> ProbGNN:
+        """Load a full-stack model.
+
+        Args:
+            dirname: The directory the model was saved to.
+            n_jobs: The number of processes to use for converting structures
+                to graphs when extracting layer outputs.
+
+        """
         data_dir = Path(dirname) / "data"
         train_datafile = data_dir / "train.fthr"
         val_datafile = data_dir / "val.fthr"
@@ -473,6 +488,7 @@ class ProbGNN(ABC):
             val_data["target"],
             save_dir=dirname,
             sf=sf,
+            n_jobs=n_jobs,
             **meta,
         )
 
@@ -500,6 +516,8 @@ class MEGNetProbModel(ProbGNN):
             Only applies when loading a model.
         sf: The pre-calculated scaling factor. Only applicable when loading
             a pre-trained model.
+        n_jobs: The number of processes to use for converting structures
+            to graphs when extracting layer outputs. ``-1`` uses all processors.
         **kwargs: Keyword arguments to pass to :class:`MEGNetModel`.
 
     """
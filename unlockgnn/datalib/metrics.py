@@ -5,12 +5,21 @@ from typing import Optional, Union, Tuple
 import numpy as np
 import tensorflow as tf
 import tensorflow_probability as tfp
+from scipy.stats import norm
 from sklearn.metrics import mean_absolute_error
 
 from .visualisation import plot_calibration, plot_sharpness
 
 tfd = tfp.distributions
 
+# The percentiles used for calibration and the upper bound of each percentile
+# on the standard normal distribution; these are constant, so compute them once
+_PREDICTED_PI = np.linspace(0, 1, 100)
+_PREDICTED_PI.flags.writeable = False
+# Computed with scipy rather than TensorFlow, so importing doesn't initialize devices
+_PI_BOUNDS = norm.ppf(_PREDICTED_PI).astype(np.float32)
+_PI_BOUNDS.flags.writeable = False
+
 
 class MetricAnalyser:
     """Handler for metric calculations.
@@ -19,8 +28,8 @@ class MetricAnalyser:
     for metrics proposed by `Kuleshov et al.`_.
     The values of :attr:`mean` and :attr:`stddevs` are not automatically updated when
     :attr:`dist` is updated, in order to save computing time.
-    :meth:`update_mean` and :meth:`update_stddevs` must be called in order to update
-    them when current values are needed.
+    :meth:`update_mean` and :meth:`update_stddevs` (or :meth:`update_mean_and_stddevs`)
+    must be called in order to update them when current values are needed.
 
     Args:
         val_points (:obj:`tf.Tensor`): The validation indices.
@@ -83,6 +92,30 @@ class MetricAnalyser:
         """Update the standard deviation predictions."""
         self.stddevs: np.ndarray = self.dist.stddev().numpy()
 
+    def update_mean_and_stddevs(
+        self,
+        predictions: Optional[
+            Tuple[Union[tf.Tensor, np.ndarray], Union[tf.Tensor, np.ndarray]]
+        ] = None,
+    ):
+        """Update the mean and standard deviation predictions together.
+
+        Args:
+            predictions (tuple of :obj:`tf.Tensor` or :obj:`np.ndarray`, optional):
+                Precalculated means and standard deviations for :attr:`val_points`,
+                such as those returned by :meth:`GPTrainer.predict`, which share
+                the costly parts of their calculation. If omitted, they are
+                calculated from :attr:`dist`.
+
+        """
+        if predictions is None:
+            self.update_mean()
+            self.update_stddevs()
+        else:
+            mean, stddevs = predictions
+            self.mean = np.asarray(mean)
+            self.stddevs = np.asarray(stddevs)
+
     @property
     def nll(self) -> float:
         """Calculate the negative log likelihood of observed true values.
@@ -111,7 +144,7 @@ class MetricAnalyser:
             sharpness (float)
 
         """
-        return np.sqrt(np.mean(np.square(self.stddevs)))
+        return np.linalg.norm(self.stddevs.ravel()) / np.sqrt(self.stddevs.size)
 
     @property
     def variation(self) -> float:
@@ -124,7 +157,7 @@ class MetricAnalyser:
 
         """
         stdev_mean = self.stddevs.mean()
-        coeff_var = np.sqrt(np.sum(np.square(self.stddevs - stdev_mean)))
+        coeff_var = np.linalg.norm((self.stddevs - stdev_mean).ravel())
         coeff_var /= stdev_mean * (len(self.stddevs) - 1)
         return coeff_var
 
@@ -183,7 +216,7 @@ class MetricAnalyser:
             residuals (:obj:`np.ndarray`): The normalised residuals of the model predictions.
 
         Returns:
-            predicted_pi (:obj:`np.ndarray`): The percentiles used.
+            predicted_pi (:obj:`np.ndarray`): The percentiles used (read-only).
             observed_pi (:obj:`np.ndarray`): The density of residuals that fall within each of the
             `predicted_pi` percentiles.
 
@@ -195,18 +228,13 @@ class MetricAnalyser:
         """
         norm_resids = self.residuals / self.stddevs  # Normalise residuals
 
-        norm = tfd.Normal(0, 1)  # Standard normal distribution
-
-        predicted_pi = np.linspace(0, 1, 100)
-        bounds = norm.quantile(
-            predicted_pi
-        ).numpy()  # Find the upper bounds for each percentile
-
-        observed_pi = np.array(
-            [np.count_nonzero(norm_resids <= bound) for bound in bounds]
-        )  # The number of residuals that fall within each percentile
-        observed_pi = (
-            observed_pi / norm_resids.size
-        )  # The fraction (density) of residuals that fall within each percentile
+        # The number of residuals that fall within each percentile,
+        # found by binary search on the sorted residuals
+        sorted_resids = np.sort(norm_resids, axis=None)
+        observed_pi = np.searchsorted(sorted_resids, _PI_BOUNDS, side="right").astype(
+            np.float64
+        )
+        # The fraction (density) of residuals that fall within each percentile
+        observed_pi /= norm_resids.size
 
-        return predicted_pi, observed_pi
+        return _PREDICTED_PI, observed_pi
@@ -1,14 +1,18 @@
 """Tools for processing the SSE data for the Gaussian Process."""
 from __future__ import annotations
 
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from typing import Dict, List, Optional, Union
 
 import numpy as np
 import pandas as pd
 import pymatgen
+from megnet.layers import Set2Set
 from megnet.models import MEGNetModel
 from tensorflow.keras import backend as K
-from tqdm.contrib import tmap
+from tqdm import tqdm
 
 from ..utilities import deserialize_array
 
@@ -21,21 +25,58 @@ class LayerExtractor:
             upon.
         layer_index (int): The index of the layer within the model to extract.
             Defaults to -4, the index of the concatenation layer.
+            The layer must give one output per graph.
 
     Attributes:
         model (:obj:`MEGNetModel`): The MEGNet model to perform extraction
             upon.
+        layer_index (int): The index of the layer within the model to extract.
         conc_layer_output (:obj:`Tensor`): The layer's unevaluated output.
         layer_eval: A Keras function for evaluating the layer.
+        _graph_converter: The model's graph converter, bound once so that its
+            bond expansion is reused for every conversion.
+
+    Raises:
+        ValueError: If the layer precedes the model's :obj:`Set2Set` readout,
+            so gives outputs per atom or per bond rather than per graph.
 
     """
 
     def __init__(self, model: MEGNetModel, layer_index: int = -4):
         """Initialize extractor."""
         self.model = model
+        self.layer_index = layer_index
+        self._check_per_graph_layer()
+        self._graph_converter = model.graph_converter
         self.conc_layer_output = model.layers[layer_index].output
         self.layer_eval = K.function([model.input], [self.conc_layer_output])
 
+    def _check_per_graph_layer(self):
+        """Check that the layer to extract is at or after the :obj:`Set2Set` readout.
+
+        MEGNet only pools atom and bond features into per-graph features in its
+        :obj:`Set2Set` layers. Earlier layers give one output per atom or per bond,
+        which cannot always be told apart from one output per graph by their
+        shape, for example when every structure has a single atom.
+
+        Raises:
+            ValueError: If the layer precedes the readout.
+
+        """
+        readout_positions = [
+            i for i, layer in enumerate(self.model.layers) if isinstance(layer, Set2Set)
+        ]
+        if not readout_positions:
+            # Not a MEGNet readout architecture; rely on the output count check
+            return
+
+        layer_position = self.layer_index % len(self.model.layers)
+        if layer_position < min(readout_positions):
+            raise ValueError(
+                f"Layer {self.layer_index} precedes the model's Set2Set readout, "
+                "so does not give one output per graph"
+            )
+
     def _convert_struct_to_inp(self, structure: pymatgen.Structure) -> List:
         """Convert a pymatgen structure to an appropriate input for the model.
 
@@ -50,8 +91,8 @@ class LayerExtractor:
                 feeding into the model.
 
         """
-        graph = self.model.graph_converter.convert(structure)
-        return self.model.graph_converter.graph_to_input(graph)
+        graph = self._graph_converter.convert(structure)
+        return self._graph_converter.graph_to_input(graph)
 
     def get_layer_output(self, structure: pymatgen.Structure) -> np.ndarray:
         """Get the layer output for the model.
@@ -78,9 +119,82 @@ class LayerExtractor:
             np.ndarray: The output of the layer.
 
         """
-        input = self.model.graph_converter.graph_to_input(graph)
+        input = self._graph_converter.graph_to_input(graph)
         return self.layer_eval([input])[0]
 
+    def get_layer_outputs(
+        self,
+        data: List[Union[pymatgen.Structure, Dict[str, np.ndarray]]],
+        use_structs: bool = True,
+        batch_size: int = 128,
+        show_pbar: bool = False,
+        n_jobs: int = 1,
+    ) -> np.ndarray:
+        """Get the layer outputs of the model for many inputs, evaluated in batches.
+
+        Inputs are merged into a single MEGNet batch (see :func:`merge_inputs`),
+        so the layer is evaluated once per batch rather than once per input.
+        This requires the extracted layer to give one output per graph, as the
+        concatenation layer does.
+
+        Args:
+            data (list of :obj:`pymatgen.Structure` or list of dict): The inputs to
+                calculate the layer output for.
+            use_structs (bool): Whether `data` are structures (`True`) or graphs (`False`).
+            batch_size (int): The number of inputs to evaluate at once.
+            show_pbar (bool): Whether to show a progress bar over the batches.
+            n_jobs (int): The number of processes to use for converting structures
+                to graphs. ``-1`` uses all processors; see :func:`get_n_workers`.
+                The layer itself is always evaluated in the main process.
+
+        Returns:
+            layer_outs (:obj:`np.ndarray`): The flattened output of the layer for
+                each input, stacked along the first axis.
+
+        Raises:
+            ValueError: If the layer does not give one output per graph.
+
+        """
+        graph_converter = self._graph_converter
+        if use_structs:
+            n_workers = get_n_workers(n_jobs)
+            if n_workers > 1:
+                # TensorFlow's thread pools are already running, so forking is unsafe
+                with ProcessPoolExecutor(
+                    max_workers=n_workers, mp_context=get_context("spawn")
+                ) as executor:
+                    graphs = list(
+                        executor.map(graph_converter.convert, data, chunksize=16)
+                    )
+            else:
+                graphs = list(map(graph_converter.convert, data))
+        else:
+            graphs = data
+
+        inputs = list(map(graph_converter.graph_to_input, graphs))
+        if not inputs:
+            # The graphs lie along the second axis; the rest are features
+            n_features = int(np.prod(self.conc_layer_output.shape[2:]))
+            return np.empty((0, n_features))
+
+        batch_starts = range(0, len(inputs), batch_size)
+        if show_pbar:
+            batch_starts = tqdm(batch_starts, "Evaluating batches")
+
+        layer_outs: List[np.ndarray] = []
+        for start in batch_starts:
+            batch_inputs = inputs[start : start + batch_size]
+            batch_out = self.layer_eval([merge_inputs(batch_inputs)])[0]
+            if batch_out.shape[1] != len(batch_inputs):
+                raise ValueError(
+                    f"Layer {self.layer_index} gave {batch_out.shape[1]} outputs for "
+                    f"{len(batch_inputs)} graphs; it must give one output per graph"
+                )
+            # Drop the leading batch axis; the graphs lie along the next one
+            layer_outs.append(batch_out.reshape(batch_out.shape[1], -1))
+
+        return np.concatenate(layer_outs)
+
 
 class LayerScaler:
     """Class for creating GP training data and preprocessing thereof.
@@ -98,6 +212,8 @@ class LayerScaler:
             Unused if extractor is passed.
             Defaults to the concatenation layer index of -4.
         extractor: The :obj:`LayerExtractor` to use for extraction.
+        n_jobs: The number of processes to use for converting structures
+            to graphs. ``-1`` uses all processors.
 
     Attributes:
         model: The MEGNet model to perform extraction
@@ -105,6 +221,8 @@ class LayerScaler:
         sf: The scaling factor.
         extractor: The extractor object used for acquiring layer
             outputs for the model.
+        n_jobs: The number of processes to use for converting structures
+            to graphs.
 
     """
 
@@ -114,10 +232,12 @@ class LayerScaler:
         sf: np.ndarray,
         layer_index: int = -4,
         extractor: Optional[LayerExtractor] = None,
+        n_jobs: int = 1,
     ):
         """Initialize class attributes."""
         self.extractor = extractor if extractor else LayerExtractor(model, layer_index)
         self.sf = sf
+        self.n_jobs = n_jobs
 
     @staticmethod
     def from_train_data(
@@ -125,6 +245,7 @@ class LayerScaler:
         train_structs: Optional[List[pymatgen.Structure]] = None,
         train_graphs: Optional[List[Dict[str, np.ndarray]]] = None,
         layer_index: int = -4,
+        n_jobs: int = 1,
     ) -> LayerScaler:
         """Create a LayerScaler instance with a scaling factor based on training data.
 
@@ -133,6 +254,8 @@ class LayerScaler:
             train_graphs: Training data as graphs.
             layer_index: The index of the layer to extract from.
                 Defaults to extraction from the concatenation layer.
+            n_jobs: The number of processes to use for converting structures
+                to graphs. ``-1`` uses all processors.
 
         Returns:
             A :obj:`LayerScaler` object.
@@ -151,7 +274,9 @@ class LayerScaler:
         extractor = LayerExtractor(model, layer_index)
 
         if ts_given:
-            layer_outs = LayerScaler._calc_layer_outs(train_structs, extractor)  # type: ignore
+            layer_outs = LayerScaler._calc_layer_outs(
+                train_structs, extractor, n_jobs=n_jobs  # type: ignore
+            )
         elif tg_given:
             layer_outs = LayerScaler._calc_layer_outs(
                 train_graphs, extractor, use_structs=False  # type: ignore
@@ -160,38 +285,37 @@ class LayerScaler:
             raise ValueError("Must pass one of `train_structs` or `train_graphs`")
 
         sf = LayerScaler._calc_scaling_factor(layer_outs)
-        return LayerScaler(model, sf, extractor=extractor)
+        return LayerScaler(model, sf, extractor=extractor, n_jobs=n_jobs)
 
-    def structures_to_input(
-        self, structures: List[pymatgen.Structure]
-    ) -> List[np.ndarray]:
-        """Convert structures to a scaled input feature vector.
+    def structures_to_input(self, structures: List[pymatgen.Structure]) -> np.ndarray:
+        """Convert structures to scaled input feature vectors.
 
         Args:
             structures (list of :obj:`pymatgen.Structure`): The structures to convert.
 
         Returns:
-            list of :obj:`np.ndarray`: The scaled feature vectors.
+            :obj:`np.ndarray`: The scaled feature vectors, stacked along the
+                first axis.
 
         """
-        return [
-            out / self.sf for out in self._calc_layer_outs(structures, self.extractor)
-        ]
+        layer_outs = self._calc_layer_outs(
+            structures, self.extractor, n_jobs=self.n_jobs
+        )
+        return layer_outs / self.sf
 
-    def graphs_to_input(self, graphs: List[Dict[str, np.ndarray]]) -> List[np.ndarray]:
-        """Convert graphs to a scaled input feature vector.
+    def graphs_to_input(self, graphs: List[Dict[str, np.ndarray]]) -> np.ndarray:
+        """Convert graphs to scaled input feature vectors.
 
         Args:
             structures (list of dict): The graphs to convert.
 
         Returns:
-            list of :obj:`np.ndarray`: The scaled feature vectors.
+            :obj:`np.ndarray`: The scaled feature vectors, stacked along the
+                first axis.
 
         """
-        return [
-            out / self.sf
-            for out in self._calc_layer_outs(graphs, self.extractor, use_structs=False)
-        ]
+        layer_outs = self._calc_layer_outs(graphs, self.extractor, use_structs=False)
+        return layer_outs / self.sf
 
     @staticmethod
     def _calc_layer_outs(
@@ -199,7 +323,8 @@ class LayerScaler:
         extractor: LayerExtractor,
         use_structs: bool = True,
         show_pbar: bool = False,
-    ) -> List[np.ndarray]:
+        n_jobs: int = 1,
+    ) -> np.ndarray:
         """Calculate the layer outputs for all structures in a list.
 
         Args:
@@ -207,44 +332,44 @@ class LayerScaler:
                 the layer output for.
             use_structs (bool): Whether `data` are structures (`True`) or graphs (`False`).
             show_pbar: Whether to show a progress bar during calculation of layer outputs.
+            n_jobs: The number of processes to use for converting structures
+                to graphs. ``-1`` uses all processors.
 
         Returns:
-            layer_outs (list of :obj:`np.ndarray`): The layer outputs.
+            layer_outs (:obj:`np.ndarray`): The layer outputs, stacked along
+                the first axis.
 
         Raises:
             TypeError: If `data` contains incompatible types.
 
         """
-        map_f = tmap if show_pbar else map
-
         if use_structs:
             if not all(isinstance(d, pymatgen.Structure) for d in data):
                 raise TypeError("`data` must be a list of structures")
-            layer_outs = map_f(extractor.get_layer_output, data)
         else:
             if not all(isinstance(d, dict) for d in data):
                 raise TypeError("`data` must be a list of dictionaries")
-            layer_outs = map_f(extractor.get_layer_output_graph, data)
 
-        # Squeeze each value to a nicer shape
-        return list(map(np.squeeze, layer_outs))
+        return extractor.get_layer_outputs(
+            data, use_structs=use_structs, show_pbar=show_pbar, n_jobs=n_jobs
+        )
 
     @staticmethod
-    def _calc_scaling_factor(layer_outs: List[np.ndarray]) -> np.ndarray:
+    def _calc_scaling_factor(layer_outs: np.ndarray) -> np.ndarray:
         """Calculate the scaling factor to use.
 
-        Scaling factor is the elementwise greatest value across
+        Scaling factor is the elementwise greatest absolute value across
         all of the `layer_out` vectors.
 
         Args:
-            layer_outs: The layer outputs.
+            layer_outs: The layer outputs, stacked along the first axis.
 
         Returns:
             sf (:obj:`np.ndarray`): The scaling factor.
 
         """
-        abs_values = list(map(np.abs, layer_outs))
-        sf = get_max_elements(abs_values)
+        # Elementwise greatest absolute value, without an absolute value temporary
+        sf = np.maximum(layer_outs.max(axis=0), -layer_outs.min(axis=0))
 
         # Replace zeros with a scaling factor of 1
         # so there's no zero division errors
@@ -252,27 +377,73 @@ class LayerScaler:
         return sf
 
 
-def get_max_elements(arrays: List[np.ndarray]) -> np.ndarray:
-    """Get the elementwise greatest value across all arrays.
+def get_n_workers(n_jobs: int) -> int:
+    """Get the number of worker processes to use for a given `n_jobs`.
 
-    Input arrays must all have the same shape.
+    Follows the `scikit-learn` convention: negative values count back from
+    the number of processors, so ``-1`` uses all of them and ``-2`` all but one.
 
     Args:
-        arrays (list of :obj:`np.ndarray`): The arrays to perform the calculation with.
+        n_jobs (int): The requested number of jobs.
 
     Returns:
-        max_array (:obj:np.ndarray): An array of the elementwise max values.
+        n_workers (int): The number of worker processes.
 
     Raises:
-        ValueError: If input arrays do not all have the same shape.
+        ValueError: If `n_jobs` is zero.
 
     """
-    shapes = set(map(np.shape, arrays))
-    if len(shapes) != 1:
-        raise ValueError("Input arrays must have uniform shape.")
+    if n_jobs == 0:
+        raise ValueError("`n_jobs` must not be zero")
+    if n_jobs < 0:
+        return max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    return n_jobs
+
 
-    stack = np.stack(arrays)
-    return np.amax(stack, axis=0)
+def merge_inputs(inputs: List[List[np.ndarray]]) -> List[np.ndarray]:
+    """Merge several MEGNet model inputs into a single batched input.
+
+    Mirrors MEGNet's own batch generators: atom, bond and state arrays are
+    concatenated, bond indices are offset by the number of preceding atoms and
+    the atom and bond graph indices are set to the position of each graph
+    within the batch.
+
+    Args:
+        inputs (list of list of :obj:`np.ndarray`): The inputs to merge, each as
+            returned by ``graph_converter.graph_to_input``.
+
+    Returns:
+        batch (list of :obj:`np.ndarray`): The merged input, ready for
+            feeding into the model.
+
+    """
+    atoms, bonds, states, index1s, index2s, gnodes, gbonds = zip(*inputs)
+
+    atom_counts = [atom.shape[1] for atom in atoms]
+    offsets = np.cumsum([0] + atom_counts[:-1])
+
+    index1 = np.concatenate(
+        [index1 + offset for index1, offset in zip(index1s, offsets)], axis=1
+    )
+    index2 = np.concatenate(
+        [index2 + offset for index2, offset in zip(index2s, offsets)], axis=1
+    )
+    gnode = np.concatenate(
+        [np.full_like(gnode, i) for i, gnode in enumerate(gnodes)], axis=1
+    )
+    gbond = np.concatenate(
+        [np.full_like(gbond, i) for i, gbond in enumerate(gbonds)], axis=1
+    )
+
+    return [
+        np.concatenate(atoms, axis=1),
+        np.concatenate(bonds, axis=1),
+        np.concatenate(states, axis=1),
+        index1,
+        index2,
+        gnode,
+        gbond,
+    ]
 
 
 def convert_graph_df(df: pd.DataFrame) -> List[Dict[str, np.ndarray]]:
@@ -283,9 +454,9 @@ def convert_graph_df(df: pd.DataFrame) -> List[Dict[str, np.ndarray]]:
     """
     # Column labels of array data
     array_cols = ["index1", "index2", "atom", "bond", "state"]
+    # Iterate over the columns together, rather than copying each row to a Series
     graphs = [
-        {col: deserialize_array(series[col]) for col in array_cols}
-        for _, series in df.iterrows()
+        {col: deserialize_array(value) for col, value in zip(array_cols, row)}
+        for row in zip(*(df[col] for col in array_cols))
     ]
-    print(f"{graphs[0]=}")
     return graphs
@@ -13,30 +13,40 @@ from ..datalib.metrics import MetricAnalyser
 deprecation._PRINT_DEPRECATION_WARNINGS = False
 
 
+tfb = tfp.bijectors
 tfd = tfp.distributions
 tfk = tfp.math.psd_kernels
 
 
-def convert_index_points(array: np.ndarray) -> tf.Tensor:
+def convert_index_points(array: np.ndarray, dtype: tf.DType = tf.float64) -> tf.Tensor:
     """Reshape an array into a tensor appropriate for GP index points.
 
     Extends the amount of dimensions by ``array.shape[-1] - 1`` and converts
-    to a `Tensor` with `dtype=tf.float64`.
+    to a `Tensor` with the given `dtype`.
+    :class:`GPTrainer` uses ``array.shape[1]`` as its kernel's `feature_ndims`,
+    so each feature vector spans the trailing dimensions of the result;
+    the kernel's distances are the same as for the unextended array.
+
+    The array is only copied if it is not already a contiguous array of
+    `dtype`, since the extension itself is a reshaped view.
 
     Args:
         array (:obj:`np.ndarray`): The array to extend.
+        dtype (:obj:`tf.DType`): The floating point type of the Tensor.
+            Defaults to `tf.float64`.
 
     Returns
         tensor (:obj:`tf.Tensor`): The converted Tensor.
 
     """
+    array = np.ascontiguousarray(array, dtype=tf.as_dtype(dtype).as_numpy_dtype)
     shape = array.shape
     try:
         shape += (1,) * (shape[1] - 1)
     except IndexError:
         # Vector input
         shape += (1,)
-    return tf.constant(array, dtype=tf.float64, shape=shape)
+    return tf.convert_to_tensor(array.reshape(shape))
 
 
 class GPTrainer(tf.Module):
@@ -47,14 +57,31 @@ class GPTrainer(tf.Module):
         observations (:obj:`tf.Tensor`): The observed samples (`y` values).
         checkpoint_dir (str or :obj:`Path`, optional): The directory to check for
             checkpoints and to save checkpoints to.
+        jit_compile (bool): Whether to compile :meth:`optimize_cycle`, :meth:`predict`
+            and the validation evaluation with XLA. This can help on GPUs, but is
+            usually slower on CPUs, where XLA's Cholesky decomposition is
+            much slower than LAPACK's. Requires TensorFlow 2.5 or later.
+        dtype (:obj:`tf.DType`): The floating point type to use for the GP.
+            `tf.float32` halves the memory and bandwidth needed for kernel
+            matrices, at the cost of a less stable Cholesky decomposition.
+            Checkpoints of the kernel parameters are specific to this type.
+            Defaults to `tf.float64`.
+
+    Raises:
+        RuntimeError: If `jit_compile` is set with TensorFlow older than 2.5.
+        ValueError: If the checkpoint in `checkpoint_dir` was saved with
+            kernel parameters of a different `dtype`.
 
     Attributes:
+        dtype (:obj:`tf.DType`): The floating point type used for the GP.
         observation_index_points (:obj:`tf.Tensor`): The observed index points (`x` values).
         observations (:obj:`tf.Tensor`): The observed samples (`y` values).
         checkpoint_dir (str or :obj:`Path`, optional): The directory to check for
             checkpoints and to save checkpoints to.
-        amplitude (:obj:`tf.Tensor`): The amplitude of the kernel.
-        length_scale (:obj:`tf.Tensor`): The length scale of the kernel.
+        amplitude (:obj:`TransformedVariable`): The amplitude of the kernel.
+            Constrained to be positive by a softplus transformation.
+        length_scale (:obj:`TransformedVariable`): The length scale of the kernel.
+            Constrained to be positive by a softplus transformation.
         kernel (:obj:`tf.Tensor`): The kernel to use for the Gaussian process.
         optimizer (:obj:`Optimizer`): The optimizer to use for determining
             :attr:`amplitude` and :attr:`length_scale`.
@@ -70,6 +97,8 @@ class GPTrainer(tf.Module):
             Defaults to `None` if `checkpoint_dir` is not passed.
         gp_prior (:obj:`GaussianProcess`): A Gaussian process using :attr:`kernel` and
             using :attr:`observation_index_points` as indices.
+        _trainable_vars (tuple of :obj:`tf.Variable`): The trainable variables,
+            cached for :meth:`optimize_cycle`.
 
     """
 
@@ -78,20 +107,27 @@ class GPTrainer(tf.Module):
         observation_index_points: tf.Tensor,
         observations: tf.Tensor,
         checkpoint_dir: Optional[Union[str, Path]] = None,
+        jit_compile: bool = False,
+        dtype: tf.DType = tf.float64,
     ):
         """Initialze attributes, kernel, optimizer and checkpoint manager."""
+        self.dtype = tf.as_dtype(dtype)
         self.observation_index_points = tf.Variable(
-            observation_index_points,
-            dtype=tf.float64,
+            tf.cast(observation_index_points, self.dtype),
             trainable=False,
             name="observation_index_points",
         )
         self.observations = tf.Variable(
-            observations, dtype=tf.float64, trainable=False, name="observations",
+            tf.cast(observations, self.dtype), trainable=False, name="observations",
         )
 
-        self.amplitude = tf.Variable(1.0, dtype=tf.float64, name="amplitude")
-        self.length_scale = tf.Variable(1.0, dtype=tf.float64, name="length_scale")
+        # Optimize the parameters in an unconstrained space, so they stay positive
+        self.amplitude = tfp.util.TransformedVariable(
+            1.0, tfb.Softplus(), dtype=self.dtype, name="amplitude"
+        )
+        self.length_scale = tfp.util.TransformedVariable(
+            1.0, tfb.Softplus(), dtype=self.dtype, name="length_scale"
+        )
 
         # TODO: Customizable kernel
         self.kernel = tfk.MaternOneHalf(
@@ -153,9 +189,17 @@ class GPTrainer(tf.Module):
                 step_counter=self.training_steps,
             )
 
-            self.ckpt.restore(self.ckpt_manager.latest_checkpoint)
-            if self.ckpt_manager.latest_checkpoint:
-                print(f"Restored from {self.ckpt_manager.latest_checkpoint}")
+            latest_checkpoint = self.ckpt_manager.latest_checkpoint
+            if latest_checkpoint:
+                self._check_checkpoint_dtype(latest_checkpoint)
+            status = self.ckpt.restore(latest_checkpoint)
+            if latest_checkpoint:
+                if self._restore_legacy_params(latest_checkpoint):
+                    # The legacy kernel parameters have been consumed by hand
+                    status.expect_partial()
+                else:
+                    status.assert_existing_objects_matched()
+                print(f"Restored from {latest_checkpoint}")
             else:
                 print("No checkpoints found.")
 
@@ -165,6 +209,85 @@ class GPTrainer(tf.Module):
 
         self.gp_prior = tfd.GaussianProcess(self.kernel, self.observation_index_points)
 
+        # Avoid walking the module's attributes on every training step
+        self._trainable_vars = tuple(self.trainable_variables)
+
+        if self.dtype != tf.float64:
+            # The serving signature must match the GP's dtype
+            self.predict = tf.function(
+                self.predict.python_function,
+                input_signature=[tf.TensorSpec(None, self.dtype)],
+            )
+
+        if jit_compile:
+            # Replace the traced methods with XLA-compiled equivalents
+            for name in ["optimize_cycle", "predict", "_evaluate"]:
+                function = getattr(self, name)
+                try:
+                    compiled = tf.function(
+                        function.python_function,
+                        input_signature=function.input_signature,
+                        jit_compile=True,
+                    )
+                except TypeError as e:
+                    # `jit_compile` was introduced in TensorFlow 2.5
+                    raise RuntimeError(
+                        "`jit_compile` requires TensorFlow 2.5 or later, "
+                        f"got {tf.__version__}"
+                    ) from e
+                setattr(self, name, compiled)
+
+    def _check_checkpoint_dtype(self, checkpoint_path: str):
+        """Check that a checkpoint's kernel parameters match :attr:`dtype`.
+
+        Legacy checkpoints are exempt, as their parameters are cast on restoration
+        by :meth:`_restore_legacy_params`.
+
+        Args:
+            checkpoint_path (str): The path to the checkpoint to read.
+
+        Raises:
+            ValueError: If the checkpoint's kernel parameters have a different dtype.
+
+        """
+        reader = tf.train.load_checkpoint(checkpoint_path)
+        for key, dtype in reader.get_variable_to_dtype_map().items():
+            path = key.split("/")
+            is_param = path[0] in ["amp", "ls"] and path[1:2] != [".ATTRIBUTES"]
+            if is_param and dtype != self.dtype:
+                raise ValueError(
+                    f"Checkpoint {checkpoint_path} has {dtype.name} kernel parameters, "
+                    f"but the GP uses {self.dtype.name}; "
+                    "use a matching `dtype` or a different `checkpoint_dir`"
+                )
+
+    def _restore_legacy_params(self, checkpoint_path: str) -> bool:
+        """Restore kernel parameters from a checkpoint in the legacy format.
+
+        Checkpoints written before :attr:`amplitude` and :attr:`length_scale`
+        became :obj:`TransformedVariable` objects store the parameters as plain
+        variables, which are not matched on restoration.
+        Their values are read directly and assigned to the parameters instead.
+
+        Args:
+            checkpoint_path (str): The path to the checkpoint to read.
+
+        Returns:
+            bool: Whether the checkpoint used the legacy format.
+
+        """
+        reader = tf.train.load_checkpoint(checkpoint_path)
+        legacy_keys = [
+            (self.amplitude, "amp/.ATTRIBUTES/VARIABLE_VALUE"),
+            (self.length_scale, "ls/.ATTRIBUTES/VARIABLE_VALUE"),
+        ]
+        if not all(reader.has_tensor(key) for _, key in legacy_keys):
+            return False
+
+        for param, key in legacy_keys:
+            param.assign(tf.cast(reader.get_tensor(key), self.dtype))
+        return True
+
     @staticmethod
     def load_model(model_dir: str):
         """Load a `GPTrainer` model from a file.
@@ -179,18 +302,30 @@ class GPTrainer(tf.Module):
         return tf.saved_model.load(model_dir)
 
     def get_model(
-        self, index_points: tf.Tensor
+        self, index_points: tf.Tensor, precompute: bool = False
     ) -> tfp.python.distributions.GaussianProcessRegressionModel:
         """Get a regression model for a set of index points.
 
         Args:
             index_points (:obj:`tf.Tensor`): The index points to fit
                 regression model.
+            precompute (bool): Whether to precompute the Cholesky decomposition of
+                the observations' kernel matrix, so that it is shared between
+                subsequent calls to the model's methods. The precomputed model
+                does not reflect later changes to the kernel parameters.
 
         Returns:
             gprm (:obj:`GaussianProcessRegressionModel`): The regression model.
 
         """
+        if precompute:
+            return tfd.GaussianProcessRegressionModel.precompute_regression_model(
+                kernel=self.kernel,
+                index_points=index_points,
+                observation_index_points=self.observation_index_points,
+                observations=self.observations,
+            )
+
         return tfd.GaussianProcessRegressionModel(
             kernel=self.kernel,
             index_points=index_points,
@@ -202,6 +337,8 @@ class GPTrainer(tf.Module):
     def predict(self, points: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
         """Predict targets and the standard deviation of the distribution.
 
+        The mean and standard deviation share a single Cholesky decomposition.
+
         Args:
             points (:obj:`tf.Tensor`): The points (`x` values) to make predictions with.
 
@@ -211,9 +348,31 @@ class GPTrainer(tf.Module):
             at each point.
 
         """
-        gprm = self.get_model(points)
+        gprm = self.get_model(points, precompute=True)
         return gprm.mean(), gprm.stddev()
 
+    @tf.function
+    def _evaluate(
+        self, val_points: tf.Tensor, val_obs: tf.Tensor
+    ) -> Dict[str, tf.Tensor]:
+        """Calculate validation predictions and negative log likelihood in one graph.
+
+        Args:
+            val_points (:obj:`tf.Tensor`): The validation points.
+            val_obs (:obj:`tf.Tensor`): The validation targets.
+
+        Returns:
+            evaluation (dict of str: :obj:`tf.Tensor`): The `mean` and `stddev`
+                of the distribution at each point and the `nll` of the targets.
+
+        """
+        gprm = self.get_model(val_points, precompute=True)
+        return {
+            "mean": gprm.mean(),
+            "stddev": gprm.stddev(),
+            "nll": -gprm.log_prob(val_obs),
+        }
+
     def train_model(
         self,
         val_points: tf.Tensor,
@@ -241,6 +400,9 @@ class GPTrainer(tf.Module):
                 last training epoch.
 
         """
+        val_points = tf.cast(val_points, self.dtype)
+        val_obs = tf.cast(val_obs, self.dtype)
+
         best_val_nll: float = self.metrics["nll"].numpy()
         if np.isnan(best_val_nll):
             # Set to infinity so < logic works
@@ -251,21 +413,41 @@ class GPTrainer(tf.Module):
             metrics.append("nll")
 
         steps_since_improvement: int = 1
-        gp_metrics = MetricAnalyser(val_points, val_obs, self.get_model(val_points))
-
-        for i in tqdm(range(epochs), "Training epochs"):
-            self.loss.assign(self.optimize_cycle())
+        gp_metrics = MetricAnalyser(
+            val_points,
+            val_obs,
+            self.get_model(val_points),
+            calc_mean_on_init=False,
+            calc_stddev_on_init=False,
+        )
+        requires_evaluation = "nll" in metrics or (
+            gp_metrics.REQUIRES_MEAN | gp_metrics.REQUIRES_STDDEV
+        ).intersection(metrics)
+
+        # Only draw the progress bar for interactive sessions, not log files
+        pbar = tqdm(range(epochs), "Training epochs", disable=None)
+        for i in pbar:
+            self.loss.assign(tf.cast(self.optimize_cycle(), tf.float64))
             self.training_steps.assign_add(1)
 
             # * Determine and assign metrics
-            if gp_metrics.REQUIRES_MEAN.intersection(metrics):
-                gp_metrics.update_mean()
-            if gp_metrics.REQUIRES_STDDEV.intersection(metrics):
-                gp_metrics.update_stddevs()
+            if requires_evaluation:
+                # Convert the evaluated tensors to NumPy arrays for the metrics
+                evaluation = tf.nest.map_structure(
+                    lambda t: t.numpy(), self._evaluate(val_points, val_obs)
+                )
+                gp_metrics.update_mean_and_stddevs(
+                    (evaluation["mean"], evaluation["stddev"])
+                )
 
             try:
                 metric_dict: Dict[str, float] = {
-                    metric: getattr(gp_metrics, metric) for metric in metrics
+                    metric: (
+                        evaluation["nll"]
+                        if metric == "nll"
+                        else getattr(gp_metrics, metric)
+                    )
+                    for metric in metrics
                 }
             except AttributeError as e:
                 raise ValueError(f"Invalid metric: {e}")
@@ -274,6 +456,7 @@ class GPTrainer(tf.Module):
                 self.metrics[metric].assign(value)
 
             metric_dict["loss"] = self.loss.numpy()
+            pbar.set_postfix(metric_dict, refresh=False)
             yield metric_dict
 
             if patience or self.ckpt_manager:
@@ -305,6 +488,6 @@ class GPTrainer(tf.Module):
         with tf.GradientTape() as tape:
             loss = -self.gp_prior.log_prob(self.observations)
 
-        grads = tape.gradient(loss, self.trainable_variables)
-        self.optimizer.apply_gradients(zip(grads, self.trainable_variables))
+        grads = tape.gradient(loss, self._trainable_vars)
+        self.optimizer.apply_gradients(zip(grads, self._trainable_vars))
         return loss